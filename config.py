@@ -1,41 +1,115 @@
 """
 Configuration settings for the Email Processor application.
 
-This module loads environment variables from a .env file (via `env_manager.py`)
-and defines default values, API constants, and the essential PARSING_MAP
-structure used to extract specific data fields from emails.
+This module defines API constants and the essential PARSING_MAP structure used
+to extract specific data fields from emails. Environment-driven settings are
+loaded from a .env file (via `env_manager.py`) lazily, on first access.
 """
+import functools
 import os
-from typing import List, Dict, Any, Final
+import re
+from dataclasses import dataclass, fields
+from typing import List, Dict, Any, Final, Optional, Pattern, Tuple
 from env_manager import load_environment
-
-# Load environment variables immediately upon module import
-load_environment()
+from parsing_tools import CombinedMatcher, build_combined_matcher, prepare_parsing_map
 
 # --- Google API and Application Constants ---
 
-# File path for the downloaded OAuth 2.0 client secrets
-CLIENT_SECRET_FILE: Final[str] = os.getenv("CLIENT_SECRET_FILE", "client_secret.json")
+# OAuth 2.0 Scopes (must be a list of strings)
+SCOPES: Final[List[str]] = ["https://www.googleapis.com/auth/gmail.modify","https://www.googleapis.com/auth/spreadsheets"]
 
-# Google Sheet information
-SPREADSHEET_ID: Final[str] = os.getenv("SPREADSHEET_ID", "")
-SHEET_NAME: Final[str] = os.getenv("SHEET_NAME", "Emails")
 
-# Gmail/Processing settings
-MAX_RESULTS: Final[int] = int(os.getenv("MAX_RESULTS", 10))
-HIGH_PRIORITY_KEYWORDS: Final[str] = os.getenv("HIGH_PRIORITY_KEYWORDS", "")
+# --- Environment-Driven Settings (loaded lazily) ---
 
-# The query used to filter which messages are fetched by Gmail API
-GMAIL_SEARCH_QUERY: Final[str] = os.getenv("GMAIL_SEARCH_QUERY", "is:unread")
+@dataclass(frozen=True)
+class _Settings:
+    """
+    Settings read from the environment. Exposed as module attributes
+    (e.g., `config.MAX_RESULTS`) through the module-level `__getattr__`.
+    """
+    # File path for the downloaded OAuth 2.0 client secrets
+    CLIENT_SECRET_FILE: str
+    # Google Sheet information
+    SPREADSHEET_ID: str
+    SHEET_NAME: str
+    # Gmail/Processing settings
+    MAX_RESULTS: int
+    HIGH_PRIORITY_KEYWORDS: str
+    # All priority keywords merged into one word-bounded alternation, so each email is
+    # scanned once regardless of how many keywords are configured (None if no keywords).
+    PRIORITY_RE: Optional[Pattern[str]]
+    # The query used to filter which messages are fetched by Gmail API
+    GMAIL_SEARCH_QUERY: str
+    # Bodies are cut to their first N characters as soon as they are decoded. Everything
+    # downstream (regexes, process-pool transfer, the sheet cell) sees at most this much;
+    # keep it at or above the 10,000-character sheet cell limit so the cell is unaffected.
+    MAX_PARSE_BYTES: int
+    # Only the first N characters of a body are scanned by the extraction and priority regexes
+    MAX_BODY_SCAN_BYTES: int
+    # Worker processes used to parse large batches of emails. Defaults to 1 (in-process):
+    # parsing costs about a millisecond per email, so a pool only pays off for very large
+    # batches, and spawn-based platforms (Windows, macOS) pay seconds of start-up.
+    PARSE_WORKERS: int
+    # Credentials file path (JSON written by Credentials.to_json())
+    TOKEN_FILE: str
+    # Legacy pickled credentials, read only to migrate existing installs to TOKEN_FILE
+    TOKEN_PICKLE: str
+    # Logging level
+    LOG_LEVEL: str
 
-# Credentials file path
-TOKEN_PICKLE: Final[str] = os.getenv("TOKEN_PICKLE", "token.pickle")
 
-# OAuth 2.0 Scopes (must be a list of strings)
-SCOPES: Final[List[str]] = ["https://www.googleapis.com/auth/gmail.modify","https://www.googleapis.com/auth/spreadsheets"]
+_SETTING_NAMES: Final[frozenset] = frozenset(f.name for f in fields(_Settings))
+
+
+@functools.cache
+def get_settings() -> _Settings:
+    """
+    Loads the .env file and reads all environment-driven settings.
+
+    Runs once, on the first access to any setting, so importing this module
+    (e.g., from tests or tools that never touch Gmail) does not parse the .env file.
+
+    Returns:
+        The memoized settings object.
+    """
+    load_environment()
 
-# Logging level
-LOG_LEVEL: Final[str] = os.getenv("LOG_LEVEL", "INFO")
+    high_priority_keywords = os.getenv("HIGH_PRIORITY_KEYWORDS", "")
+    priority_keywords = [kw.strip().lower() for kw in high_priority_keywords.split(",") if kw.strip()]
+    # Words of multi-word keywords may be separated by any whitespace run (including newlines)
+    keyword_patterns = [r"\s+".join(re.escape(word) for word in kw.split()) for kw in priority_keywords]
+    # Stdlib `re`, not RE2: RE2's \s and \b are ASCII-only, so "action\xa0needed" would
+    # stop matching; the escaped-literal alternation cannot backtrack catastrophically
+    priority_re = (
+        re.compile(r"\b(?:" + "|".join(keyword_patterns) + r")\b")
+        if keyword_patterns else None
+    )
+
+    return _Settings(
+        CLIENT_SECRET_FILE=os.getenv("CLIENT_SECRET_FILE", "client_secret.json"),
+        SPREADSHEET_ID=os.getenv("SPREADSHEET_ID", ""),
+        SHEET_NAME=os.getenv("SHEET_NAME", "Emails"),
+        MAX_RESULTS=int(os.getenv("MAX_RESULTS", 10)),
+        HIGH_PRIORITY_KEYWORDS=high_priority_keywords,
+        PRIORITY_RE=priority_re,
+        GMAIL_SEARCH_QUERY=os.getenv("GMAIL_SEARCH_QUERY", "is:unread"),
+        MAX_PARSE_BYTES=int(os.getenv("MAX_PARSE_BYTES") or 20000),
+        MAX_BODY_SCAN_BYTES=int(os.getenv("MAX_BODY_SCAN_BYTES") or 16384),
+        PARSE_WORKERS=int(os.getenv("PARSE_WORKERS") or 1),
+        TOKEN_FILE=os.getenv("TOKEN_FILE", "token.json"),
+        TOKEN_PICKLE=os.getenv("TOKEN_PICKLE", "token.pickle"),
+        LOG_LEVEL=os.getenv("LOG_LEVEL", "INFO"),
+    )
+
+
+def __getattr__(name: str) -> Any:
+    """
+    Resolves environment-driven settings on first access (PEP 562), so
+    `config.MAX_RESULTS` and friends keep working unchanged.
+    """
+    if name in _SETTING_NAMES:
+        return getattr(get_settings(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # --- Data Extraction Mapping ---
@@ -45,6 +119,9 @@ LOG_LEVEL: Final[str] = os.getenv("LOG_LEVEL", "INFO")
 # - output_field: The key used in the final parsed data dictionary and in the Sheet header.
 # - method: The parsing technique ('key_value', 'regex_pattern', or 'header').
 # - Additional fields are specific to the method (e.g., 'key_patterns', 'pattern', 'header_name').
+# - re2 (optional): True compiles a 'key_value'/'regex_pattern' rule with google-re2 when it is
+#   installed. RE2 runs in linear time, which suits hand-written patterns that could backtrack
+#   badly, but its \s, \d, \w and \b match ASCII only (e.g., no non-breaking spaces or accents).
 PARSING_MAP: Final[List[Dict[str, Any]]] = [
     # --- 1. Key-Value Fields (Relies on stable 'extract_key_value') ---
     # These fields must be clearly labeled in the body.
@@ -81,4 +158,28 @@ PARSING_MAP: Final[List[Dict[str, Any]]] = [
         # Matches common date formats like YYYY-MM-DD or MM/DD/YYYY
         "pattern": r"Date\s*:\s*(\d{4}[-/]\d{2}[-/]\d{2}|\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
     },
-]
\ No newline at end of file
+]
+
+
+# --- Precompiled Extraction Patterns ---
+
+# Every instruction gets its '_compiled' pattern once, at import
+prepare_parsing_map(PARSING_MAP)
+
+# All 'key_value' and 'regex_pattern' instructions fused into one pattern, so a body without
+# any extracted field is rejected in one scan (None if there are none or they cannot be combined).
+COMBINED_MATCHER: Final[Optional[CombinedMatcher]] = build_combined_matcher(PARSING_MAP)
+
+# Whether any 'regex_pattern' instruction was fused, i.e. the combined scan is needed
+# even for bodies that contain none of the KEY_VALUE_LITERALS
+COMBINED_HAS_REGEX: Final[bool] = COMBINED_MATCHER is not None and any(
+    PARSING_MAP[i].get("method") == "regex_pattern" for i in COMBINED_MATCHER.indices
+)
+
+# Lowercased literal keys of all 'key_value' instructions. A cheap substring check
+# against these lets the parser skip key_value matching for bodies containing none of them.
+KEY_VALUE_LITERALS: Final[Tuple[str, ...]] = tuple(
+    key.strip().lower()
+    for instruction in PARSING_MAP if instruction.get("method") == "key_value"
+    for key in instruction.get("key_patterns", []) if key.strip()
+)
@@ -1,12 +1,18 @@
-from base64 import urlsafe_b64decode
+from html import unescape
+import logging
 import re
 from typing import Dict, List, Any, Optional
-from parsing_tools import extract_key_value, extract_regex_pattern
+from parsing_tools import extract_all, extract_key_value, extract_regex_pattern
 
-from utils.logger import setup_logger
 import config
 
-logger = setup_logger(__name__)
+try:
+    # SIMD-accelerated drop-in replacement for the stdlib decoder
+    from pybase64 import urlsafe_b64decode
+except ImportError:
+    from base64 import urlsafe_b64decode
+
+logger = logging.getLogger(__name__)
 
 
 def safe_b64_decode(data: Optional[str]) -> str:
@@ -34,10 +40,20 @@ def safe_b64_decode(data: Optional[str]) -> str:
         return ''
 
 
+# Line/paragraph breaks, turned into newlines before the tags are dropped
+_HTML_BREAK_RE = re.compile(r"(?i)<br\s*/?>|</p\s*>")
+# Script/style blocks (with their content) and every remaining tag, dropped in one pass
+_HTML_DROP_RE = re.compile(r"(?is)<(script|style)\b.*?</\1\s*>|<[^>]+>")
+
+
 def strip_html(html: Optional[str]) -> str:
     """
     Converts HTML content into clean plaintext, handling common formatting elements.
 
+    <br> and </p> become newlines, then one compiled alternation drops script/style
+    blocks and all other tags; entities are then decoded. Both substitutions use
+    constant replacements, so no Python callback runs per tag.
+
     Args:
         html: The HTML string to be cleaned.
 
@@ -47,29 +63,24 @@ def strip_html(html: Optional[str]) -> str:
     if not html:
         return ''
 
-    # 1. Remove script and style tags (case-insensitive, including content)
-    html = re.sub(r"(?is)<(script|style).*?>.*?(</\1>)", "", html)
-
-    # 2. Replace structural tags with newlines for better paragraph breaks
-    html = re.sub(r"(?i)<br\s*/?>", "\n", html)
-    html = re.sub(r"(?i)</p>", "\n", html)
-
-    # 3. Remove all remaining HTML tags
-    text = re.sub(r"<[^>]+>", "", html)
+    text = _HTML_DROP_RE.sub("", _HTML_BREAK_RE.sub("\n", html))
+    if "&" in text:
+        text = unescape(text)
 
-    # 4. Collapse multiple whitespace characters (including newlines from step 2) into a single space, then strip
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
+    # Collapse multiple whitespace characters (including emitted newlines) into a single space;
+    # str.split() splits on the same Unicode whitespace as \s and drops leading/trailing runs
+    return " ".join(text.split())
 
 
 def extract_text_body(payload: Dict) -> str:
     """
-    Recursively searches the message payload for the best available plaintext body.
+    Searches the message payload for the best available plaintext body.
 
-    Prioritizes:
-    1. text/plain part (returns immediately)
-    2. text/html part (strips HTML and returns)
-    3. Searches nested parts recursively.
+    Walks the MIME tree with an explicit stack (depth-first, in document order)
+    instead of recursion. Prioritizes:
+    1. The first text/plain part with data anywhere in the tree (returns immediately)
+    2. Otherwise the first text/html part (decoded and stripped only when needed)
+    3. Otherwise the payload's own body data.
 
     Args:
         payload: The 'payload' dictionary from the full Gmail message object.
@@ -81,32 +92,29 @@ def extract_text_body(payload: Dict) -> str:
         return ''
 
     # Handle the case where the payload itself is a text part
-    mime = payload.get("mimeType", "")
-    if mime == "text/plain":
-        data = payload.get("body", {}).get("data", "")
-        return safe_b64_decode(data)
-
-    parts: List[Dict] = payload.get('parts', [])
-    for part in parts:
-        p_mime = part.get('mimeType', "")
-
-        # Strategy 1: Find and prioritize the text/plain part
-        if p_mime == 'text/plain':
-            data = part.get('body', {}).get('data', "")
-            if data:
+    if payload.get("mimeType", "") == "text/plain":
+        return safe_b64_decode(payload.get("body", {}).get("data", ""))
+
+    html_fallback: Optional[str] = None
+    stack: List[Dict] = [payload]
+    while stack:
+        part = stack.pop()
+        p_mime = part.get("mimeType", "")
+        data = part.get("body", {}).get("data", "")
+
+        if data:
+            # Strategy 1: Find and prioritize the text/plain part
+            if p_mime == "text/plain":
                 return safe_b64_decode(data)
+            # Strategy 2: Remember the first text/html part as a fallback
+            if p_mime == "text/html" and html_fallback is None:
+                html_fallback = data
 
-        # Strategy 2: If no plaintext, fallback to text/html and strip tags
-        if p_mime == 'text/html':
-            data = part.get('body', {}).get('data', "")
-            if data:
-                return strip_html(safe_b64_decode(data))
+        # Strategy 3: Descend into nested parts, reversed so they pop in document order
+        stack.extend(reversed(part.get("parts", [])))
 
-        # Strategy 3: Handle nested messages (e.g., attachments or alternative views)
-        if part.get("parts"):
-            nested = extract_text_body(part)
-            if nested:
-                return nested
+    if html_fallback is not None:
+        return strip_html(safe_b64_decode(html_fallback))
 
     # Final attempt: check the main body if it has data but was missed above
     data = payload.get('body', {}).get('data', "")
@@ -133,6 +141,23 @@ def get_header(headers: List[Dict], name: str) -> str:
     return ""
 
 
+def build_header_index(headers: List[Dict]) -> Dict[str, str]:
+    """
+    Builds a case-insensitive lookup table of header values, keeping the first
+    occurrence of each name (the same value `get_header` would return).
+
+    Args:
+        headers: The list of header dictionaries from the message payload.
+
+    Returns:
+        A dictionary mapping lowercased header names to their values.
+    """
+    index: Dict[str, str] = {}
+    for h in headers:
+        index.setdefault(h.get("name", "").lower(), h.get("value", ""))
+    return index
+
+
 def parse_email(full_message: Dict) -> Dict[str, Any]:
     """
     Parses a full Gmail message object, extracts standard headers/body, and applies
@@ -149,12 +174,15 @@ def parse_email(full_message: Dict) -> Dict[str, Any]:
     """
     payload = full_message.get("payload", {})
     headers: List[Dict] = payload.get("headers", [])
+    # Index headers once so every lookup below is O(1) instead of a list scan
+    headers_by_name = build_header_index(headers)
 
     # Extract standard fields
-    subject = get_header(headers, "Subject")
-    from_raw = get_header(headers, "From")
-    date = get_header(headers, "Date")
-    body = extract_text_body(payload)
+    subject = headers_by_name.get("subject", "")
+    from_raw = headers_by_name.get("from", "")
+    date = headers_by_name.get("date", "")
+    # Huge (e.g., HTML-heavy) bodies are cut right away; nothing downstream needs more
+    body = extract_text_body(payload)[:config.MAX_PARSE_BYTES]
 
     parsed: Dict[str, Any] = {
         "Message ID": full_message.get("id"),
@@ -167,40 +195,53 @@ def parse_email(full_message: Dict) -> Dict[str, Any]:
     }
 
     # --- Apply Custom Parsing Rules (PARSING_MAP) ---
-    for instruction in config.PARSING_MAP:
+    # Data of interest sits near the top; bounding the scanned text bounds regex time on
+    # huge (e.g., HTML marketing) bodies. The full body is still kept for the sheet cell.
+    scan_body = body[:config.MAX_BODY_SCAN_BYTES]
+    body_lower = scan_body.lower()
+    # Skip all key_value rules when the body contains none of their keys (common for newsletters)
+    has_key_values = any(key in body_lower for key in config.KEY_VALUE_LITERALS)
+
+    # All fusable key_value/regex_pattern rules go through the combined matcher; the scan
+    # is skipped only when nothing but (absent) key_value rules could match
+    matcher = config.COMBINED_MATCHER
+    fused = matcher.indices if matcher is not None else frozenset()
+    if matcher is not None and (has_key_values or config.COMBINED_HAS_REGEX):
+        parsed.update(extract_all(scan_body, matcher))
+
+    for i, instruction in enumerate(config.PARSING_MAP):
         output_field = instruction.get("output_field")
         method = instruction.get("method")
         extracted_value = ""
 
+        if i in fused:
+            # Already handled by the combined matcher above
+            continue
+
         if method == "header":
             # Extract directly from email headers
-            extracted_value = get_header(headers, instruction.get("header_name", ""))
+            extracted_value = headers_by_name.get(instruction.get("header_name", "").lower(), "")
 
-        elif method == "key_value":
+        elif method == "key_value" and has_key_values:
             # Extract data using predefined key patterns and delimiters from the body
-            extracted_value = extract_key_value(body, instruction)
+            extracted_value = extract_key_value(scan_body, instruction)
 
         elif method == "regex_pattern":
             # Extract data using a custom regular expression from the body
-            extracted_value = extract_regex_pattern(body, instruction)
+            extracted_value = extract_regex_pattern(scan_body, instruction)
 
         # Only add the extracted field if a value was actually found
         if extracted_value and output_field:
             parsed[output_field] = extracted_value
 
     # --- Priority Flagging ---
-    combined_content = f"{subject or ''} {body or ''} {from_raw or ''}".lower()
-    combined_content = re.sub(r"\s+", " ", combined_content).strip()
-
-    # Split the config string into individual keywords (assuming comma-separated)
-    priority_keywords = [kw.strip() for kw in config.HIGH_PRIORITY_KEYWORDS.split(',') if kw.strip()]
-
-    for kw in priority_keywords:
-        # Use word boundaries (\b) for precise keyword matching
-        pattern = rf"\b{re.escape(kw.lower())}\b"
-        if re.search(pattern, combined_content):
-            parsed["Priority"] = "High"
-            break
+    # No whitespace collapsing needed: \b is whitespace-agnostic and PRIORITY_RE
+    # matches any whitespace run between the words of multi-word keywords
+    combined_content = f"{(subject or '').lower()} {body_lower} {(from_raw or '').lower()}"
+
+    # Single scan against the precompiled keyword alternation (word-bounded for precise matching)
+    if config.PRIORITY_RE and config.PRIORITY_RE.search(combined_content):
+        parsed["Priority"] = "High"
 
     logger.info("Parsed message id=%s, subject='%s', priority=%s",
                 parsed["Message ID"], subject[:40] + "..." if len(subject) > 40 else subject, parsed["Priority"])
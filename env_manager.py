@@ -5,11 +5,11 @@ Utilities for loading and saving configuration settings using a .env file.
 
 Relies on the `python-dotenv` library for file operations.
 """
+import logging
 import os
 from dotenv import load_dotenv, set_key
-from utils.logger import setup_logger
 
-logger = setup_logger(__name__)
+logger = logging.getLogger(__name__)
 
 
 def load_environment(env_path: str = '.env') -> None:
@@ -8,48 +8,138 @@ All network operations implement exponential backoff and retry logic for stabili
 Target: Python 3.10+
 """
 
+import logging
 import os
 import pickle
+import threading
 import time
-from typing import List, Tuple, Optional, Set, Union
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Tuple, Optional, Set, Union
 
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
+from googleapiclient.model import JsonModel
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 
+try:
+    import orjson
+except ImportError:  # Optional accelerator; the stdlib json parser is used without it
+    orjson = None
+
 # Assuming these modules exist in your project structure
-from utils.logger import setup_logger
 import config
 
-logger = setup_logger(__name__)
+logger = logging.getLogger(__name__)
+
+# Per-thread state of the fetch workers (each holds its own HTTP connection)
+_worker_state = threading.local()
 
 # --- Constants for API and Backoff ---
 _LIST_MAX_PER_PAGE = 500  # Gmail API practical page size cap
+_BATCH_MAX_REQUESTS = 50  # Gmail allows 100 calls per batch but recommends <= 50 to avoid rate limiting
 _INITIAL_BACKOFF = 1.0  # seconds
 _MAX_ATTEMPTS = 5
-
-# Defensive defaults derived from config, ensuring a fallback value
-_DEFAULT_TOKEN_PICKLE = config.TOKEN_PICKLE or "token.pickle"
+# Batched sub-requests failing with these statuses are retried: rate limits (Gmail reports
+# per-user limits as 403 or 429) and transient server errors
+_RETRYABLE_STATUSES = frozenset({403, 429, 500, 502, 503, 504})
+_BATCH_MODIFY_MAX_IDS = 1000  # Gmail's cap on message IDs per batchModify call
+# Threads fetching message batches while listing continues. A batch of 50 messages.get
+# calls costs 250 quota units (5 each), Gmail's whole per-user budget per second, so
+# only one batch is kept in flight; more workers just trade speed for 429 retries
+_FETCH_WORKERS = 1
+_MAX_PART_DEPTH = 4  # Deepest MIME nesting requested from Gmail (e.g., mixed > related > alternative > text)
 
 
 # -------------------------
 # Helpers
 # -------------------------
-def _normalize_scopes(scopes: Optional[Union[list[str], str]]) -> List[str]:
+class _FastJsonModel(JsonModel):
+    """
+    JsonModel that parses API responses and serializes request bodies with `orjson`
+    when it is installed.
+
+    Responses are dominated by long base64 body strings, and Sheets appends by rows
+    carrying up to 10,000 characters of body text; orjson is several times faster
+    than the stdlib for both, and the resulting dicts/JSON are equivalent.
+    """
+
+    def serialize(self, body_value):
+        if orjson is None:
+            return super().serialize(body_value)
+        if isinstance(body_value, dict) and "data" not in body_value and self._data_wrapper:
+            body_value = {"data": body_value}
+        try:
+            # Sent as UTF-8 bytes rather than str: http.client would encode a str as
+            # Latin-1, and Content-Length is taken from len(body), which must count bytes
+            return orjson.dumps(body_value)
+        except orjson.JSONEncodeError:
+            return super().serialize(body_value)
+
+    def deserialize(self, content):
+        if orjson is None:
+            return super().deserialize(content)
+        try:
+            body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # Non-JSON bodies keep the stock handling (returned as text)
+            return super().deserialize(content)
+        if self._data_wrapper and isinstance(body, dict) and "data" in body:
+            body = body["data"]
+        return body
+
+
+def _build_message_fields(max_depth: int) -> str:
     """
-    Normalize scopes coming from config or the caller into a cleaned list of strings.
+    Builds the partial-response `fields` mask for messages.get, limited to the data
+    parse_email reads: IDs, headers and the MIME tree's mimeType/body data.
+
+    Args:
+        max_depth: How many levels of nested `parts` to request.
+
+    Returns:
+        The `fields` parameter value.
+    """
+    part_fields = "mimeType,body/data"
+    for _ in range(max_depth):
+        part_fields = f"mimeType,body/data,parts({part_fields})"
+    return f"id,threadId,payload(headers(name,value),{part_fields})"
+
+
+# Partial-response masks: skip attachment metadata, labels, sizes and other unused data
+_LIST_FIELDS = "messages/id,nextPageToken"
+_GET_FIELDS = _build_message_fields(_MAX_PART_DEPTH)
+
+
+def _normalize_scopes(scopes: Optional[Union[list[str], Tuple[str, ...], str]]) -> Tuple[str, ...]:
+    """
+    Normalize scopes coming from config or the caller into a cleaned tuple of strings.
+
+    Lists are converted to tuples so the result can be memoized by `_normalize_scopes_cached`.
 
     Args:
         scopes: A list of scope strings or a comma-separated string of scopes.
 
     Returns:
-        A list of cleaned, non-empty scope strings.
+        A tuple of cleaned, non-empty scope strings.
 
     Raises:
         ValueError: If no valid scopes are provided.
     """
+    if isinstance(scopes, list):
+        scopes = tuple(scopes)
+    return _normalize_scopes_cached(scopes)
+
+
+@lru_cache(maxsize=4)
+def _normalize_scopes_cached(scopes: Optional[Union[Tuple[str, ...], str]]) -> Tuple[str, ...]:
+    """
+    Memoized implementation of `_normalize_scopes` (inputs must be hashable).
+    """
     if scopes is None:
         raw = config.SCOPES
     else:
@@ -57,39 +147,182 @@ def _normalize_scopes(scopes: Optional[Union[list[str], str]]) -> List[str]:
 
     if isinstance(raw, str):
         parts = [s.strip() for s in raw.split(",")]
-    elif isinstance(raw, list):
-        # Convert list items to string just in case they are not
+    elif isinstance(raw, (list, tuple)):
+        # Convert items to string just in case they are not
         parts = [str(s).strip() for s in raw]
     else:
         parts = []
 
-    cleaned = [s for s in parts if s]
+    cleaned = tuple(s for s in parts if s)
     if not cleaned:
         raise ValueError("No valid OAuth scopes provided. Set SCOPES in your .env/config.")
     return cleaned
 
 
-def _save_credentials(token_pickle: str, creds: Credentials) -> None:
+# Required scopes from config as a set, built once for the credential scope check
+_SCOPES_SET: FrozenSet[str] = frozenset(_normalize_scopes(None))
+
+
+def _save_credentials(token_file: str, creds: Credentials) -> None:
     """
-    Persist credentials to disk, creating the parent directory if necessary.
+    Persist credentials to disk as JSON, creating the parent directory if necessary.
 
     Args:
-        token_pickle: Path to the file where credentials will be stored.
+        token_file: Path to the JSON file where credentials will be stored.
         creds: The authorized Credentials object to save.
     """
-    parent = os.path.dirname(token_pickle) or "."
+    parent = os.path.dirname(token_file) or "."
     os.makedirs(parent, exist_ok=True)
-    with open(token_pickle, "wb") as f:
-        pickle.dump(creds, f)
-    logger.debug("Credentials saved to %s", token_pickle)
+    with open(token_file, "w", encoding="utf-8") as f:
+        f.write(creds.to_json())
+    logger.debug("Credentials saved to %s", token_file)
+
+
+def _load_legacy_pickle(token_pickle: str) -> Optional[Credentials]:
+    """
+    Loads credentials from the legacy pickle token file, if present, so existing
+    installs migrate to the JSON token file without re-authenticating.
+
+    Args:
+        token_pickle: Path to the legacy pickled credentials.
+
+    Returns:
+        The unpickled Credentials object, or None if missing or unreadable.
+    """
+    if not os.path.exists(token_pickle):
+        return None
+    try:
+        with open(token_pickle, "rb") as f:
+            creds = pickle.load(f)
+        logger.info("Loaded legacy credentials from %s; they will be saved as JSON.", token_pickle)
+        return creds
+    except Exception as e:
+        logger.warning("Unable to load legacy token file %s: %s.", token_pickle, e)
+        return None
+
+
+def _execute_get_batch(gmail_service: object, msg_ids: List[str],
+                       http: Optional[AuthorizedHttp] = None) -> Tuple[Dict[str, dict], Dict[str, Exception]]:
+    """
+    Fetches several full messages in a single HTTP round-trip using a batch request.
+
+    Args:
+        gmail_service: Initialized Gmail API service object.
+        msg_ids: The message IDs to fetch (at most _BATCH_MAX_REQUESTS).
+        http: The HTTP object to send the batch with. Defaults to the service's own.
+
+    Returns:
+        A tuple of (responses keyed by message ID, per-message exceptions keyed by message ID).
+    """
+    responses: Dict[str, dict] = {}
+    failures: Dict[str, Exception] = {}
+
+    def _collect(request_id: str, response: dict, exception: Optional[Exception]) -> None:
+        if exception is not None:
+            failures[request_id] = exception
+        else:
+            responses[request_id] = response
+
+    batch = gmail_service.new_batch_http_request(callback=_collect)
+    for msg_id in msg_ids:
+        batch.add(
+            gmail_service.users().messages().get(userId="me", id=msg_id, format="full", fields=_GET_FIELDS),
+            request_id=msg_id,
+        )
+    batch.execute(http=http)
+    return responses, failures
+
+
+def _fetch_batch_with_retries(gmail_service: object, msg_ids: List[str],
+                              http: Optional[AuthorizedHttp] = None) -> Dict[str, dict]:
+    """
+    Fetches one batch of full messages, retrying only the failed IDs with exponential backoff.
+
+    Args:
+        gmail_service: Initialized Gmail API service object.
+        msg_ids: The message IDs to fetch (at most _BATCH_MAX_REQUESTS).
+        http: The HTTP object to send the batch with. Defaults to the service's own.
+
+    Returns:
+        The fetched full messages keyed by message ID; messages that kept failing are omitted.
+    """
+    fetched: Dict[str, dict] = {}
+    pending = list(msg_ids)
+    attempt = 0
+    while pending:
+        try:
+            responses, failures = _execute_get_batch(gmail_service, pending, http)
+        except HttpError as he:
+            # The batch request itself failed; every message in it is retried
+            responses, failures = {}, {mid: he for mid in pending}
+        except Exception as e:
+            logger.error("Unexpected error fetching batch of %d messages: %s; skipping.", len(pending), e)
+            break
+
+        fetched.update(responses)
+        logger.debug("Fetched %d full messages in batch.", len(responses))
+
+        pending = []
+        for msg_id, exc in failures.items():
+            if isinstance(exc, HttpError) and exc.resp.status in _RETRYABLE_STATUSES:
+                pending.append(msg_id)
+            elif isinstance(exc, HttpError):
+                # e.g., 404 for a message deleted after listing; retrying cannot succeed
+                logger.error("HttpError fetching message %s: %s; skipping.", msg_id, exc)
+            else:
+                logger.error("Unexpected error fetching message %s: %s", msg_id, exc)
+
+        if pending:
+            attempt += 1
+            delay = _INITIAL_BACKOFF * (2 ** attempt)
+            if attempt >= _MAX_ATTEMPTS:
+                logger.error("Failed to fetch %d messages after %d attempts; skipping: %s",
+                             len(pending), attempt, ", ".join(pending))
+                break
+            logger.warning("HttpError fetching %d messages (attempt %d): %s. Retrying in %.1fs",
+                           len(pending), attempt, failures[pending[0]], delay)
+            time.sleep(delay)
+
+    return fetched
+
+
+def _fetch_batch_in_worker(gmail_service: object, msg_ids: List[str], creds: Credentials) -> Dict[str, dict]:
+    """
+    Worker-thread entry point for `_fetch_batch_with_retries`.
+
+    httplib2 connections are not thread-safe, so each worker thread sends its
+    batches over its own authorized HTTP object instead of the service's shared one.
+
+    Args:
+        gmail_service: Initialized Gmail API service object.
+        msg_ids: The message IDs to fetch (at most _BATCH_MAX_REQUESTS).
+        creds: The credentials used to authorize the worker's HTTP object.
+
+    Returns:
+        The fetched full messages keyed by message ID.
+    """
+    http = getattr(_worker_state, "http", None)
+    if http is None:
+        http = AuthorizedHttp(creds, http=build_http())
+        _worker_state.http = http
+    return _fetch_batch_with_retries(gmail_service, msg_ids, http)
+
+
+@lru_cache(maxsize=1)
+def _auth_request() -> Request:
+    """
+    Returns the shared token-refresh transport, so every refresh reuses one
+    requests.Session (and its pooled connections) instead of creating a new one.
+    """
+    return Request()
 
 
 # -------------------------
 # Core functions
 # -------------------------
 def get_credentials(
-    client_secret_file: str = config.CLIENT_SECRET_FILE,
-    token_pickle: str = _DEFAULT_TOKEN_PICKLE,
+    client_secret_file: Optional[str] = None,
+    token_file: Optional[str] = None,
     scopes: Optional[List[str]] = None,
 ) -> Credentials:
     """
@@ -101,7 +334,9 @@ def get_credentials(
 
     Args:
         client_secret_file: Path to the downloaded OAuth 2.0 client secret file.
-        token_pickle: Path where the serialized credentials (token) are stored.
+                            Defaults to config.CLIENT_SECRET_FILE.
+        token_file: Path where the credentials (token) are stored as JSON.
+                    Defaults to config.TOKEN_FILE.
         scopes: A list of Google API scopes required for the application.
                 Defaults to the list defined in the config module.
 
@@ -113,23 +348,31 @@ def get_credentials(
         ValueError: If scopes are missing or invalid.
         Exception: For other unexpected failures during the OAuth process.
     """
+    # Resolve defaults from config at call time (config settings are loaded lazily)
+    client_secret_file = client_secret_file or config.CLIENT_SECRET_FILE
+    # Defensive default, ensuring a fallback value
+    token_file = token_file or config.TOKEN_FILE or "token.json"
+
     # Validate client secret file path early
     if not os.path.exists(client_secret_file):
         raise FileNotFoundError(f"CLIENT_SECRET_FILE not found: {client_secret_file}")
 
-    scopes_list = _normalize_scopes(scopes)
+    scopes_list = list(_normalize_scopes(scopes))
+    required_scopes = _SCOPES_SET if scopes is None else frozenset(scopes_list)
 
     creds: Optional[Credentials] = None
 
-    # Try loading existing creds
-    if os.path.exists(token_pickle):
+    # Try loading existing creds (scopes are taken from the file, i.e., the granted ones)
+    if os.path.exists(token_file):
         try:
-            with open(token_pickle, "rb") as f:
-                creds = pickle.load(f)
-            logger.info("Loaded existing credentials from %s", token_pickle)
+            creds = Credentials.from_authorized_user_file(token_file)
+            logger.info("Loaded existing credentials from %s", token_file)
         except Exception as e:
-            logger.warning("Unable to load token file %s: %s. Proceeding to re-auth.", token_pickle, e)
+            logger.warning("Unable to load token file %s: %s. Proceeding to re-auth.", token_file, e)
             creds = None
+    else:
+        # Migration path: read a legacy pickle token once; it is re-saved as JSON below
+        creds = _load_legacy_pickle(config.TOKEN_PICKLE)
 
     # Check validity and determine if re-authentication/refresh is needed
     try:
@@ -137,7 +380,7 @@ def get_credentials(
         needs_auth = (
             creds is None
             or not getattr(creds, "valid", False)
-            or not set(scopes_list).issubset(set(getattr(creds, "scopes", []) or []))
+            or not required_scopes.issubset(getattr(creds, "scopes", None) or ())
         )
 
         if needs_auth:
@@ -145,7 +388,7 @@ def get_credentials(
             if creds and getattr(creds, "expired", False) and getattr(creds, "refresh_token", None):
                 logger.info("Refreshing expired credentials...")
                 try:
-                    creds.refresh(Request())
+                    creds.refresh(_auth_request())
                     logger.info("Credentials refreshed.")
                 except Exception as e:
                     logger.warning("Refresh failed: %s. Falling back to full OAuth flow.", e)
@@ -154,10 +397,10 @@ def get_credentials(
             # 2. Perform full OAuth flow if refresh failed or conditions weren't met
             if creds is None:
                 # Clean up potentially corrupted token file
-                if os.path.exists(token_pickle):
+                if os.path.exists(token_file):
                     try:
-                        os.remove(token_pickle)
-                        logger.debug("Removed old/corrupted token file: %s", token_pickle)
+                        os.remove(token_file)
+                        logger.debug("Removed old/corrupted token file: %s", token_file)
                     except Exception:
                         logger.debug("Unable to remove token file; continuing.")
 
@@ -172,9 +415,9 @@ def get_credentials(
 
     # Persist the final, valid credentials before returning
     try:
-        _save_credentials(token_pickle, creds)
+        _save_credentials(token_file, creds)
     except Exception as e:
-        logger.warning("Failed to save credentials to %s: %s", token_pickle, e)
+        logger.warning("Failed to save credentials to %s: %s", token_file, e)
 
     return creds
 
@@ -183,6 +426,11 @@ def build_services(creds: Credentials) -> Tuple[object, object]:
     """
     Initializes and builds the Google Gmail and Sheets API service objects.
 
+    Each service builds its own authorized HTTP object from the credentials.
+    httplib2 pools connections per scheme and host, and Gmail and Sheets are
+    served from different hosts, so a shared object could not reuse connections
+    between them.
+
     Args:
         creds: The authorized Credentials object.
 
@@ -193,10 +441,14 @@ def build_services(creds: Credentials) -> Tuple[object, object]:
         Exception: If the service objects cannot be initialized (e.g., wrong API name/version).
     """
     try:
+        # Discovery documents come from the copies bundled with google-api-python-client
+        # (static_discovery=True), so building never fetches them over the network; the
+        # discovery cache only applies to fetched documents and is disabled
+        discovery_options = {"static_discovery": True, "cache_discovery": False}
         # Build Gmail API service (version v1)
-        gmail_service = build("gmail", "v1", credentials=creds)
+        gmail_service = build("gmail", "v1", credentials=creds, model=_FastJsonModel(), **discovery_options)
         # Build Google Sheets API service (version v4)
-        sheets_service = build("sheets", "v4", credentials=creds)
+        sheets_service = build("sheets", "v4", credentials=creds, model=_FastJsonModel(), **discovery_options)
 
         logger.info("Google API services built (Gmail + Sheets).")
         return gmail_service, sheets_service
@@ -206,116 +458,124 @@ def build_services(creds: Credentials) -> Tuple[object, object]:
 
 
 def fetch_unread_full_emails(gmail_service: object,
-                             max_results: int = config.MAX_RESULTS,
-                             query: str = config.GMAIL_SEARCH_QUERY) -> List[dict]:
+                             max_results: Optional[int] = None,
+                             query: Optional[str] = None) -> List[dict]:
     """
     Fetches the full payload of up to `max_results` unread emails, handling API pagination.
 
     The process involves:
     1. Paginatedly listing message IDs using a custom query.
     2. Deduplicating the collected IDs.
-    3. Iterating through the unique IDs to fetch the full message payload (format='full').
-    Both listing and fetching steps include retries with exponential backoff for resilience.
+    3. Fetching the full message payloads (format='full') in batch requests of up to
+       _BATCH_MAX_REQUESTS messages each, one HTTP round-trip per batch. Batches are
+       handed to a background fetch thread as soon as their list page arrives, so
+       fetching overlaps with listing the remaining pages while staying within
+       Gmail's per-user quota.
+    Both listing and fetching steps include retries with exponential backoff for resilience;
+    only the messages that failed within a batch are retried.
 
     Args:
         gmail_service: Initialized Gmail API service object.
         max_results: Maximum total number of full messages to retrieve.
                      Defaults to config.MAX_RESULTS.
+        query: Gmail search query used to select messages.
+               Defaults to config.GMAIL_SEARCH_QUERY.
 
     Returns:
         A list of dictionaries, where each dictionary is the full message payload.
         Returns an empty list if `max_results` is non-positive or on irrecoverable error.
     """
+    if max_results is None:
+        max_results = config.MAX_RESULTS
+    if query is None:
+        query = config.GMAIL_SEARCH_QUERY
+
     if max_results <= 0:
         logger.info("max_results <= 0; returning empty list.")
         return []
 
     logger.info("Starting unread email fetch (max_results=%s)...", max_results)
 
-    all_ids: List[dict] = []
-    page_token: Optional[str] = None
+    # Worker threads need their own connections, built from the service's credentials.
+    # Without them (e.g., a custom http object), batches are fetched inline after each page.
+    creds = getattr(getattr(gmail_service, "_http", None), "credentials", None)
+    executor = ThreadPoolExecutor(max_workers=_FETCH_WORKERS, thread_name_prefix="gmail-fetch") if creds else None
 
-    # 1) Listing loop with pagination & retries (for batch failures)
-    while len(all_ids) < max_results:
-        # Calculate size for the current API call (cap at max_results or _LIST_MAX_PER_PAGE)
-        batch_size = min(max_results - len(all_ids), _LIST_MAX_PER_PAGE)
-        attempt = 0
-
-        while True:
-            try:
-                # Execute the list request
-                resp = gmail_service.users().messages().list(
-                    userId="me",
-                    q=query,
-                    maxResults=batch_size,
-                    pageToken=page_token,
-                ).execute()
-                break  # Success, exit retry loop
-            except HttpError as he:
-                attempt += 1
-                delay = _INITIAL_BACKOFF * (2 ** attempt)
-                logger.warning("HttpError listing messages (attempt %d): %s. Retrying in %.1fs", attempt, he, delay)
-                if attempt >= _MAX_ATTEMPTS:
-                    logger.error("Too many retries listing messages; aborting list phase.")
-                    return []  # Abort early, safer for client
-                time.sleep(delay)
-            except Exception as e:
-                logger.error("Unexpected error listing messages: %s", e)
-                return []
+    msg_ids: List[str] = []
+    seen: Set[str] = set()
+    fetched: Dict[str, dict] = {}
+    futures: List[Future] = []
+    page_token: Optional[str] = None
 
-        messages = resp.get("messages", [])
-        if messages:
-            all_ids.extend(messages)
-            logger.info("Collected %d message IDs (total %d).", len(messages), len(all_ids))
+    def _submit(batch_ids: List[str]) -> None:
+        # 2) Fetch full messages in batches while listing continues
+        if executor is not None:
+            futures.append(executor.submit(_fetch_batch_in_worker, gmail_service, batch_ids, creds))
         else:
-            logger.debug("No messages returned in this page.")
+            fetched.update(_fetch_batch_with_retries(gmail_service, batch_ids))
 
-        page_token = resp.get("nextPageToken")
-        # Stop if no next page token or we've reached desired count
-        if not page_token or len(all_ids) >= max_results:
-            break
-
-    # Deduplicate IDs (important if messages are retrieved across multiple list calls)
-    seen: Set[str] = set()
-    unique_ids: List[dict] = []
-    for m in all_ids:
-        mid = m.get("id")
-        if mid and mid not in seen:
-            seen.add(mid)
-            unique_ids.append(m)
-    # Trim the list to max_results in case the last page exceeded the soft cap
-    unique_ids = unique_ids[:max_results]
-    logger.info("Finished list phase. Attempting to fetch %d unique messages.", len(unique_ids))
-
-    # 2) Fetch full messages with retry/backoff per message
-    full_messages: List[dict] = []
-    for idx, mid_dict in enumerate(unique_ids):
-        msg_id = mid_dict.get("id")
-        if not msg_id:
-            continue
+    try:
+        # 1) Listing loop with pagination & retries (for batch failures)
+        while len(msg_ids) < max_results:
+            # Calculate size for the current API call (cap at max_results or _LIST_MAX_PER_PAGE)
+            batch_size = min(max_results - len(msg_ids), _LIST_MAX_PER_PAGE)
+            attempt = 0
 
-        attempt = 0
-        while True:
-            try:
-                full = gmail_service.users().messages().get(
-                    userId="me",
-                    id=msg_id,
-                    format="full",
-                ).execute()
-                full_messages.append(full)
-                logger.debug("Fetched full message %s (%d/%d)", msg_id, idx + 1, len(unique_ids))
-                break  # Success, exit retry loop
-            except HttpError as he:
-                attempt += 1
-                delay = _INITIAL_BACKOFF * (2 ** attempt)
-                logger.warning("HttpError fetching message %s (attempt %d): %s. Retrying in %.1fs", msg_id, attempt, he, delay)
-                if attempt >= _MAX_ATTEMPTS:
-                    logger.error("Failed to fetch message %s after %d attempts; skipping.", msg_id, attempt)
-                    break # Skip to next message
-                time.sleep(delay)
-            except Exception as e:
-                logger.error("Unexpected error fetching message %s: %s", msg_id, e)
-                break # Skip to next message
+            while True:
+                try:
+                    # Execute the list request
+                    resp = gmail_service.users().messages().list(
+                        userId="me",
+                        q=query,
+                        maxResults=batch_size,
+                        pageToken=page_token,
+                        fields=_LIST_FIELDS,
+                    ).execute()
+                    break  # Success, exit retry loop
+                except HttpError as he:
+                    attempt += 1
+                    delay = _INITIAL_BACKOFF * (2 ** attempt)
+                    logger.warning("HttpError listing messages (attempt %d): %s. Retrying in %.1fs", attempt, he, delay)
+                    if attempt >= _MAX_ATTEMPTS:
+                        logger.error("Too many retries listing messages; aborting list phase.")
+                        return []  # Abort early, safer for client
+                    time.sleep(delay)
+                except Exception as e:
+                    logger.error("Unexpected error listing messages: %s", e)
+                    return []
+
+            # Deduplicate IDs (important if messages are retrieved across multiple list calls),
+            # capped at max_results in case the page exceeded the soft cap
+            page_ids: List[str] = []
+            for m in resp.get("messages", []):
+                mid = m.get("id")
+                if mid and mid not in seen and len(msg_ids) < max_results:
+                    seen.add(mid)
+                    msg_ids.append(mid)
+                    page_ids.append(mid)
+
+            if page_ids:
+                logger.info("Collected %d message IDs (total %d).", len(page_ids), len(msg_ids))
+                for offset in range(0, len(page_ids), _BATCH_MAX_REQUESTS):
+                    _submit(page_ids[offset:offset + _BATCH_MAX_REQUESTS])
+            else:
+                logger.debug("No messages returned in this page.")
+
+            page_token = resp.get("nextPageToken")
+            # Stop if no next page token or we've reached desired count
+            if not page_token:
+                break
+
+        logger.info("Finished list phase. Waiting for %d unique messages.", len(msg_ids))
+        for future in futures:
+            fetched.update(future.result())
+    finally:
+        if executor is not None:
+            # On an aborted listing, drop batches that have not started yet
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    # Preserve the listing order in the returned messages
+    full_messages: List[dict] = [fetched[mid] for mid in msg_ids if mid in fetched]
 
     logger.info("Completed fetch: %d full messages retrieved.", len(full_messages))
     return full_messages
@@ -353,4 +613,43 @@ def mark_as_read(gmail_service: object, msg_id: str, max_attempts: int = _MAX_AT
             time.sleep(delay)
         except Exception as e:
             logger.error("Unexpected error marking %s as read: %s", msg_id, e)
-            return
\ No newline at end of file
+            return
+
+
+def mark_many_as_read(gmail_service: object, msg_ids: List[str], max_attempts: int = _MAX_ATTEMPTS) -> None:
+    """
+    Remove the 'UNREAD' label from many messages with `batchModify`, one request per
+    chunk of up to _BATCH_MODIFY_MAX_IDS IDs instead of one request per message.
+
+    Implements retries with exponential backoff on network/API errors for each chunk.
+
+    Args:
+        gmail_service: Initialized Gmail API service object.
+        msg_ids: The IDs of the messages to be marked as read.
+        max_attempts: The maximum number of times to attempt each chunk.
+    """
+    for offset in range(0, len(msg_ids), _BATCH_MODIFY_MAX_IDS):
+        chunk = msg_ids[offset:offset + _BATCH_MODIFY_MAX_IDS]
+        attempt = 0
+        while True:
+            try:
+                # batchModify returns an empty body on success
+                gmail_service.users().messages().batchModify(
+                    userId="me",
+                    body={"ids": chunk, "removeLabelIds": ["UNREAD"]},
+                ).execute()
+                logger.debug("Marked %d messages as read.", len(chunk))
+                break  # Success, continue with the next chunk
+            except HttpError as he:
+                attempt += 1
+                delay = _INITIAL_BACKOFF * (2 ** attempt)
+                logger.warning("HttpError marking %d messages as read (attempt %d): %s. Retrying in %.1fs",
+                               len(chunk), attempt, he, delay)
+                if attempt >= max_attempts:
+                    logger.error("Failed to mark %d messages as read after %d attempts; giving up: %s",
+                                 len(chunk), attempt, ", ".join(chunk))
+                    break
+                time.sleep(delay)
+            except Exception as e:
+                logger.error("Unexpected error marking %d messages as read: %s", len(chunk), e)
+                break
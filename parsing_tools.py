@@ -1,24 +1,116 @@
+import functools
+import logging
 import re
-from typing import Dict, List, Any
-from utils.logger import setup_logger
+from typing import Dict, FrozenSet, List, Any, NamedTuple, Optional, Pattern, Tuple
 
-logger = setup_logger(__name__)
+try:
+    import re2
+except ImportError:  # Optional linear-time engine; stdlib re is used without it
+    re2 = None
 
+logger = logging.getLogger(__name__)
 
-def extract_key_value(text: str, config: Dict[str, Any]) -> str:
+# Flags that have an equivalent google-re2 option (see compile_pattern)
+_RE2_SUPPORTED_FLAGS = re.IGNORECASE | re.DOTALL
+
+# Numbered backreferences (e.g., \1) would point at the wrong group once a pattern
+# is embedded in a combined alternation, so such patterns are never fused
+_NUMBERED_BACKREF_RE = re.compile(r"\\[1-9]")
+
+# Patterns compiled for instructions without a precompiled '_compiled' entry (e.g., ad-hoc
+# instructions outside config.PARSING_MAP), so each distinct pattern is compiled once per process
+_KV_CACHE: Dict[Tuple[Tuple[str, ...], str, bool], Pattern[str]] = {}
+_RX_CACHE: Dict[Tuple[str, bool], Pattern[str]] = {}
+
+# Memoized regex_pattern results keyed by (compiled pattern, text). Keys hold body text
+# (capped at MAX_BODY_SCAN_BYTES by the parser), so the cache is kept modest.
+_SEARCH_CACHE_MAXSIZE = 1024
+
+
+def compile_pattern(pattern: str, flags: int = 0) -> Pattern[str]:
     """
-    Finds a value associated with a specified key pattern in the text.
+    Compiles a pattern with google-re2 when it is installed, falling back to stdlib `re`.
 
-    This method is designed to find structured data like "Key: Value" or
-    "Key - Value" within the email body. It accepts multiple key patterns.
+    RE2 matches in linear time, so untrusted email bodies cannot trigger catastrophic
+    backtracking. Patterns RE2 does not support (e.g., lookarounds, backreferences)
+    or unsupported flags silently fall back to `re`; both expose `.search()`,
+    `.finditer()` and `.group()` the same way. RE2's \\s, \\d, \\w and \\b match ASCII
+    only, so results can differ from `re` on Unicode text; parsing instructions use it
+    only when they opt in (see `compile_instruction_pattern`).
+
+    Args:
+        pattern: The regular expression to compile.
+        flags: `re` flags; only re.IGNORECASE and re.DOTALL are mapped to RE2.
+
+    Returns:
+        The compiled pattern object.
+
+    Raises:
+        re.error: If the pattern is invalid for the stdlib engine as well.
+    """
+    if re2 is not None and not flags & ~_RE2_SUPPORTED_FLAGS:
+        options = re2.Options()
+        options.case_sensitive = not flags & re.IGNORECASE
+        options.dot_nl = bool(flags & re.DOTALL)
+        # Unsupported syntax is expected here; don't let RE2 print it to stderr
+        options.log_errors = False
+        try:
+            return re2.compile(pattern, options)
+        except re2.error:
+            pass
+    return re.compile(pattern, flags)
+
+
+def compile_instruction_pattern(instruction: Dict[str, Any], pattern: str, flags: int = 0) -> Pattern[str]:
+    """
+    Compiles the pattern of one parsing instruction with stdlib `re`, or with
+    `compile_pattern` (google-re2 when installed) if the instruction sets 're2': True.
+
+    Stdlib `re` is the default because its Unicode-aware classes keep values such as
+    "Status\\xa0: ok" or "José" intact, and the escaped key_value patterns cannot
+    backtrack catastrophically. RE2 is meant for hand-written 'regex_pattern' rules
+    that could.
+
+    Args:
+        instruction: The parsing instruction the pattern belongs to.
+        pattern: The regular expression to compile.
+        flags: `re` flags.
+
+    Returns:
+        The compiled pattern object.
+
+    Raises:
+        re.error: If the pattern is invalid.
+    """
+    if instruction.get("re2"):
+        return compile_pattern(pattern, flags)
+    return re.compile(pattern, flags)
+
+
+class CombinedMatcher(NamedTuple):
+    """
+    Several parsing instructions fused into one alternation pattern.
+
+    The fused pattern only locates the offsets where at least one instruction
+    matches; `members` holds, in parsing-map order, each fused instruction's
+    position in the map, output field and own compiled pattern, which is searched
+    from the first such offset. `indices` holds the positions of all fused instructions.
+    """
+    pattern: Pattern[str]
+    members: Tuple[Tuple[int, str, Pattern[str]], ...]
+    indices: FrozenSet[int]
+
+
+def build_key_value_pattern(config: Dict[str, Any]) -> str:
+    """
+    Builds the full regex pattern used by `extract_key_value` for one instruction.
 
     Args:
-        text: The clean plaintext email body.
         config: A dictionary containing parsing instructions.
                 Expected keys: 'key_patterns' (List[str]), 'delimiter' (str).
 
     Returns:
-        The extracted value as a string, or an empty string if not found.
+        The uncompiled pattern string, or an empty string if no usable key patterns exist.
     """
     # Use explicit type annotation for local variable for clarity
     key_patterns: List[str] = config.get("key_patterns", [])
@@ -36,9 +128,6 @@ def extract_key_value(text: str, config: Dict[str, Any]) -> str:
         # It's a simple character (like ":"). Escape it for safety.
         delimiter_regex = re.escape(raw_delimiter)
 
-    if not text or not key_patterns:
-        return ""
-
     # 1. Prepare key patterns for combined regex
     # Escape key patterns as they might contain regex-sensitive characters (like parentheses)
     escaped_patterns = [re.escape(k.strip()) for k in key_patterns if k.strip()]
@@ -47,12 +136,187 @@ def extract_key_value(text: str, config: Dict[str, Any]) -> str:
 
     #2. Construct the finale pattern:
     # Use a non-capturing group (?:...) for the keys, followed by the delimiter.
-    # The value (.*?) is captured non-greedily until the positive lookahead is met.
-    # The lookahead (?=\n|$) forces the match to stop right before a newline OR the end of the string.
-    full_pattern = rf"(?:{'|'.join(escaped_patterns)})\s*{delimiter_regex}\s*(.*?)(?=\n|$)"
+    # The value ([^\n\r]*) runs to the end of the line in one linear sweep; unlike a
+    # non-greedy (.*?) with a lookahead, it never backtracks on long single-line bodies.
+    # Whitespace padding is only added on the sides where the delimiter has none of its
+    # own: two adjacent \s* runs backtrack quadratically over long whitespace without a
+    # delimiter (e.g. "Status" followed by thousands of spaces).
+    leading = "" if delimiter_regex.startswith(r"\s*") else r"\s*"
+    trailing = "" if delimiter_regex.endswith(r"\s*") else r"\s*"
+    return rf"(?:{'|'.join(escaped_patterns)}){leading}{delimiter_regex}{trailing}([^\n\r]*)"
+
+
+def prepare_parsing_map(parsing_map: List[Dict[str, Any]]) -> None:
+    """
+    Compiles the pattern of every parsing instruction once (with stdlib `re` unless the
+    instruction opts into google-re2, see `compile_instruction_pattern`) and stores it
+    under the '_compiled' key, so the extractors call `.search()` directly instead of
+    re-escaping the keys and rebuilding the same pattern for every message. Already
+    prepared instructions are left as they are.
+
+    Args:
+        parsing_map: The list of parsing instructions to prepare in place.
+    """
+    for instruction in parsing_map:
+        if instruction.get("_compiled") is not None:
+            continue
+        method = instruction.get("method")
+        try:
+            if method == "key_value":
+                full_pattern = build_key_value_pattern(instruction)
+                if full_pattern:
+                    instruction["_compiled"] = compile_instruction_pattern(
+                        instruction, full_pattern, re.IGNORECASE
+                    )
+            elif method == "regex_pattern" and instruction.get("pattern"):
+                instruction["_compiled"] = compile_instruction_pattern(
+                    instruction, instruction["pattern"], re.IGNORECASE | re.DOTALL
+                )
+        except re.error:
+            # Leave the instruction uncompiled; the extractor logs the invalid pattern at parse time
+            continue
+
+
+def build_combined_matcher(parsing_map: List[Dict[str, Any]]) -> Optional[CombinedMatcher]:
+    """
+    Fuses the 'key_value' and 'regex_pattern' instructions into a single alternation
+    pattern, so a body in which none of them matches is rejected in one scan instead of
+    one search per instruction (see `extract_all`).
+
+    Instructions that cannot be fused (invalid patterns, 'regex_pattern' rules without
+    a capture group or with numbered backreferences, and rules compiled with
+    google-re2) are left out of the matcher and keep going through the
+    per-instruction extractors.
+
+    Args:
+        parsing_map: The list of parsing instructions (e.g., config.PARSING_MAP).
+
+    Returns:
+        The combined matcher, or None if no instruction could be fused.
+    """
+    branches: List[str] = []
+    members: List[Tuple[int, str, Pattern[str]]] = []
+
+    for i, instruction in enumerate(parsing_map):
+        output_field = instruction.get("output_field")
+        method = instruction.get("method")
+        own_pattern = instruction.get("_compiled")
+        if not output_field or own_pattern is None:
+            # Uncompiled (e.g., invalid) instructions are left to the per-instruction path, which logs them
+            continue
+        if not isinstance(own_pattern, re.Pattern):
+            # The fused pattern runs on stdlib re, whose matches differ from RE2's (Unicode
+            # classes, backtracking); a rule that opted into RE2 keeps its own search
+            continue
+
+        if method == "key_value":
+            branch = build_key_value_pattern(instruction)
+        elif method == "regex_pattern":
+            branch = instruction.get("pattern", "")
+            if _NUMBERED_BACKREF_RE.search(branch):
+                continue
+            try:
+                if not re.compile(branch).groups:
+                    continue
+            except re.error:
+                continue
+            # DOTALL is scoped to this branch, as extract_regex_pattern compiles it with re.DOTALL
+            branch = f"(?s:{branch})"
+        else:
+            continue
+        if not branch:
+            continue
 
-    # re.IGNORECASE makes the key match case-insensitive
-    match = re.search(full_pattern, text, re.IGNORECASE)
+        branches.append(f"(?:{branch})")
+        members.append((i, output_field, own_pattern))
+
+    if not branches:
+        return None
+
+    try:
+        # The alternation sits inside a zero-width lookahead so matches never consume text:
+        # every offset where any instruction matches is reported, including keys inside
+        # another field's value. re.IGNORECASE makes the key match case-insensitive
+        pattern = re.compile(f"(?=(?:{'|'.join(branches)}))", re.IGNORECASE)
+    except re.error as e:
+        # e.g., the same named group in several patterns; fall back to per-instruction matching
+        logger.warning("Unable to combine parsing instructions into one pattern: %s", e)
+        return None
+    return CombinedMatcher(pattern, tuple(members), frozenset(i for i, _, _ in members))
+
+
+def extract_all(text: str, matcher: CombinedMatcher) -> Dict[str, str]:
+    """
+    Collects the value of every fused field, rejecting texts without any match in one scan.
+
+    The fused lookahead reports every offset where at least one instruction matches,
+    so no instruction can match before its first hit. From that offset each
+    instruction runs its own `search` once, which finds the same first match as a
+    separate search of the whole text: rules that share a key or match at the same
+    offset never shadow each other, and a field missing from the text costs one
+    search rather than a retry at every later hit.
+
+    As in the per-instruction loop of `parse_email`, empty values are left out and a
+    later instruction with the same output field overrides an earlier one.
+
+    Args:
+        text: The clean plaintext email body.
+        matcher: The matcher built by `build_combined_matcher`.
+
+    Returns:
+        A dictionary mapping output fields to their extracted (stripped) values.
+    """
+    if not text:
+        return {}
+
+    first_hit = matcher.pattern.search(text)
+    if first_hit is None:
+        return {}
+
+    start = first_hit.start()
+    results: Dict[str, str] = {}
+    for _, output_field, own_pattern in matcher.members:
+        match = own_pattern.search(text, start)
+        if match is None:
+            continue
+        # Same extraction as extract_key_value/extract_regex_pattern: the first capture group
+        value = (match.group(1) or "").strip() if match.groups() else ""
+        if value:
+            results[output_field] = value
+    return results
+
+
+def extract_key_value(text: str, config: Dict[str, Any]) -> str:
+    """
+    Finds a value associated with a specified key pattern in the text.
+
+    This method is designed to find structured data like "Key: Value" or
+    "Key - Value" within the email body. It accepts multiple key patterns.
+
+    Args:
+        text: The clean plaintext email body.
+        config: A dictionary containing parsing instructions.
+                Expected keys: 'key_patterns' (List[str]), 'delimiter' (str).
+                If present, the precompiled '_compiled' pattern is used directly.
+
+    Returns:
+        The extracted value as a string, or an empty string if not found.
+    """
+    if not text:
+        return ""
+
+    compiled: Optional[Pattern[str]] = config.get("_compiled")
+    if compiled is None:
+        cache_key = (tuple(config.get("key_patterns", [])), config.get("delimiter", ""), bool(config.get("re2")))
+        compiled = _KV_CACHE.get(cache_key)
+        if compiled is None:
+            full_pattern = build_key_value_pattern(config)
+            if not full_pattern:
+                return ""
+            # re.IGNORECASE makes the key match case-insensitive
+            compiled = _KV_CACHE[cache_key] = compile_instruction_pattern(config, full_pattern, re.IGNORECASE)
+
+    match = compiled.search(text)
 
     if match:
         # Return the content of the outermost capture group (group 1), stripped of leading/trailing whitespace
@@ -61,6 +325,35 @@ def extract_key_value(text: str, config: Dict[str, Any]) -> str:
     return ""
 
 
+@functools.lru_cache(maxsize=_SEARCH_CACHE_MAXSIZE)
+def _cached_search(compiled: Pattern[str], text: str) -> str:
+    """
+    Returns the stripped first capture group of `compiled.search(text)`, memoized so
+    templated emails (e.g., notifications from the same sender) are searched once.
+
+    Args:
+        compiled: The compiled regular expression.
+        text: The text to search.
+
+    Returns:
+        The stripped first capture group, or an empty string if there is no match or no group.
+    """
+    match = compiled.search(text)
+
+    # Check if a match was found and if it contains capture groups
+    if match and match.groups():
+        # Return the content of the first capture group (group 1)
+        return match.group(1).strip()
+    return ""
+
+
+def clear_search_cache() -> None:
+    """
+    Drops the memoized `extract_regex_pattern` results (and the email bodies they key on).
+    """
+    _cached_search.cache_clear()
+
+
 def extract_regex_pattern(text: str, config: Dict[str, Any]) -> str:
     """
     Extracts a value using a custom, full regular expression pattern defined in the config.
@@ -72,24 +365,30 @@ def extract_regex_pattern(text: str, config: Dict[str, Any]) -> str:
         text: The clean plaintext email body.
         config: A dictionary containing parsing instructions.
                 Expected key: 'pattern' (str) containing at least one capture group.
+                If present, the precompiled '_compiled' pattern is used directly.
+
+    Results are memoized per (pattern, text) until `clear_search_cache` is called.
 
     Returns:
         The extracted value from the first capture group, or an empty string.
     """
     pattern: str = config.get("pattern", "")
+    compiled: Optional[Pattern[str]] = config.get("_compiled")
 
-    if not text or not pattern:
+    if not text or not (pattern or compiled):
         return ""
 
     try:
-        # re.IGNORECASE: case-insensitive matching
-        # re.DOTALL: makes '.' match newlines, useful for multiline extraction
-        match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
-
-        # Check if a match was found and if it contains capture groups
-        if match and match.groups():
-            # Return the content of the first capture group (group 1)
-            return match.group(1).strip()
+        if compiled is None:
+            cache_key = (pattern, bool(config.get("re2")))
+            compiled = _RX_CACHE.get(cache_key)
+            if compiled is None:
+                # re.IGNORECASE: case-insensitive matching
+                # re.DOTALL: makes '.' match newlines, useful for multiline extraction
+                compiled = _RX_CACHE[cache_key] = compile_instruction_pattern(
+                    config, pattern, re.IGNORECASE | re.DOTALL
+                )
+        return _cached_search(compiled, text)
     except re.error as e:
         # Log or handle invalid regex patterns gracefully
         logger.error(f"Unexpected error extracting regex pattern from {text}: {e}")
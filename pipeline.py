@@ -9,20 +9,34 @@ The end-to-end runnable script that executes the entire workflow:
 5. Mark processed emails as read.
 """
 import datetime
+import logging
+import queue
+import threading
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import UTC
-from typing import Dict, List, Any
+from pickle import PicklingError
+from typing import Dict, Iterable, Iterator, List, Any, NamedTuple, Optional, Sequence, Tuple
 
-from utils.logger import setup_logger
+from utils.logger import LOG_LEVEL, configure_root, configure_worker, get_log_queue
 
 import config
-from gmail_services import get_credentials, build_services, fetch_unread_full_emails, mark_as_read
+from gmail_services import get_credentials, build_services, fetch_unread_full_emails, mark_many_as_read
 from email_parser import parse_email
+from parsing_tools import clear_search_cache
 from save_to_sheets import ensure_header_row, append_rows
 
-logger = setup_logger(__name__)
+logger = logging.getLogger(__name__)
 
+# Below this many messages, process start-up costs more than parallel parsing saves
+_PARALLEL_PARSE_MIN_MESSAGES = 32
+_PARSE_CHUNKSIZE = 8
+# Bounds on rows sent in one values.append request by the background sheet writer; the
+# minimum keeps a slow parser from spending the Sheets write quota on tiny requests
+_SHEETS_MIN_APPEND_ROWS = 50
+_SHEETS_MAX_APPEND_ROWS = 500
 
-def get_final_header() -> List[str]:
+
+def get_final_header() -> Tuple[str, ...]:
     """
     Generates the final header row based on standard fields and custom fields
     defined in the configuration map.
@@ -37,14 +51,43 @@ def get_final_header() -> List[str]:
     # This extracts the required output column name for every parsing instruction
     custom_fields = [inst["output_field"] for inst in config.PARSING_MAP]
 
-    return standard_fields + custom_fields
+    return tuple(standard_fields + custom_fields)
+
 
+# Define the FINAL_HEADER here so it can be accessed throughout the module (immutable)
+FINAL_HEADER: Tuple[str, ...] = get_final_header()
 
-# Define the FINAL_HEADER here so it can be accessed throughout the module
-FINAL_HEADER: List[str] = get_final_header()
 
+class _RowPlan(NamedTuple):
+    """Column keys of a header plus the positions of the columns that need special handling."""
+    keys: Tuple[str, ...]
+    body_idx: Optional[int]
+    date_idx: Optional[int]
 
-def build_row(parsed: Dict[str, Any], header: List[str]) -> List[Any]:
+
+def _build_row_plan(header: Sequence[str]) -> _RowPlan:
+    """
+    Precomputes how `build_row` lays out a row for the given header.
+
+    Args:
+        header: The full list of column names (Standard + Custom).
+
+    Returns:
+        The row plan for this header.
+    """
+    keys = tuple(header)
+    return _RowPlan(
+        keys=keys,
+        body_idx=keys.index("Body (plain)") if "Body (plain)" in keys else None,
+        date_idx=keys.index("Date") if "Date" in keys else None,
+    )
+
+
+# Plan for FINAL_HEADER, computed once instead of re-deriving it for every row
+_FINAL_ROW_PLAN: _RowPlan = _build_row_plan(FINAL_HEADER)
+
+
+def build_row(parsed: Dict[str, Any], header: Sequence[str]) -> List[Any]:
     """
     Converts a dictionary of parsed email data into a list (row) of values,
     based on the exact order of the provided header list.
@@ -56,27 +99,156 @@ def build_row(parsed: Dict[str, Any], header: List[str]) -> List[Any]:
     Returns:
         A list of strings/values ready to be appended to the Google Sheet.
     """
-    row = []
+    plan = _FINAL_ROW_PLAN if header is FINAL_HEADER else _build_row_plan(header)
 
-    for field_name in header:
-        # Use .get() with a fallback empty string for robustness (handles missing custom fields)
-        value = parsed.get(field_name, "")
+    # Use .get() with a fallback empty string for robustness (handles missing custom fields)
+    row = [parsed.get(key, "") for key in plan.keys]
 
-        # Apply specific logic for truncation only to the body field
-        if field_name == "Body (plain)":
-            row.append(str(value)[:10000])
-        elif field_name == "Date":
-            # Use fallback date if the parsed dictionary is missing the date
-            row.append(value or datetime.datetime.now(UTC).isoformat())
-        else:
-            row.append(value)
+    # Apply specific logic for truncation only to the body field
+    if plan.body_idx is not None:
+        row[plan.body_idx] = str(row[plan.body_idx])[:10000]
+    # Use fallback date if the parsed dictionary is missing the date
+    if plan.date_idx is not None:
+        row[plan.date_idx] = row[plan.date_idx] or datetime.datetime.now(UTC).isoformat()
 
     return row
 
+
+def _parse_message(message: Dict) -> Tuple[Optional[str], Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Parses one message without raising, so it can be mapped across worker processes.
+
+    Args:
+        message: The full message dictionary retrieved from the Gmail API.
+
+    Returns:
+        A tuple of (message ID, parsed data or None, error description or None).
+    """
+    try:
+        return message.get("id"), parse_email(message), None
+    except Exception as e:
+        return message.get("id"), None, str(e)
+
+
+def iter_parsed_messages(messages: List[Dict]) -> Iterator[Dict[str, Any]]:
+    """
+    Parses all fetched messages, spreading large batches across a process pool, and
+    yields each parsed message as soon as it (and every message before it) is ready.
+
+    Parsing is CPU-bound (regex, base64, HTML stripping), so worker processes are
+    used instead of threads. Where a process pool cannot be used (e.g., platforms
+    without working multiprocessing semaphores, or a worker crash), the remaining
+    messages are parsed on a thread pool instead. Small batches are parsed in-process.
+
+    Args:
+        messages: The full message dictionaries retrieved from the Gmail API.
+
+    Yields:
+        The parsed dictionary of every message that parsed successfully, in input order.
+    """
+    def _report(results: Iterable[Tuple[Optional[str], Optional[Dict[str, Any]], Optional[str]]]
+                ) -> Iterator[Dict[str, Any]]:
+        for message_id, parsed, error in results:
+            if parsed is None:
+                logger.error("Failed to parse message id=%s: %s", message_id, error)
+            else:
+                yield parsed
+
+    workers = config.PARSE_WORKERS
+    if workers <= 1 or len(messages) < _PARALLEL_PARSE_MIN_MESSAGES:
+        yield from _report(map(_parse_message, messages))
+        return
+
+    logger.info("Parsing %d emails across %d worker processes.", len(messages), workers)
+    done = 0  # Messages already handed out; a fallback resumes after them
+    try:
+        # Workers hand their records to this process's log listener rather than
+        # writing (and rotating) the shared log file themselves
+        with ProcessPoolExecutor(max_workers=workers, initializer=configure_worker,
+                                 initargs=(get_log_queue(), LOG_LEVEL)) as executor:
+            for result in executor.map(_parse_message, messages, chunksize=_PARSE_CHUNKSIZE):
+                done += 1
+                yield from _report([result])
+    except (OSError, NotImplementedError, BrokenExecutor, PicklingError) as e:
+        logger.warning("Process pool unavailable (%s); parsing on %d threads instead.", e, workers)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="parse") as executor:
+            yield from _report(executor.map(_parse_message, messages[done:]))
+
+
+class _SheetWriter:
+    """
+    Background consumer that appends rows to the sheet while parsing continues.
+
+    Rows are queued together with their message ID. Once at least
+    _SHEETS_MIN_APPEND_ROWS rows (or the last row) are queued, the writer thread appends
+    whatever has accumulated, up to _SHEETS_MAX_APPEND_ROWS rows per request, so uploads
+    overlap with parsing and coalesce when the API is slower than the parser.
+    Only the IDs of rows that were actually saved are reported in `saved_ids`.
+    """
+
+    def __init__(self, sheets_service: object) -> None:
+        self._sheets_service = sheets_service
+        self._queue: "queue.Queue[Optional[Tuple[List[Any], Optional[str]]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._saved_ids: List[Optional[str]] = []
+        self.saved_rows = 0
+        self.failed_rows = 0
+        self._thread = threading.Thread(target=self._run, name="sheets-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, row: List[Any], message_id: Optional[str]) -> None:
+        """Queues one row for upload."""
+        self._queue.put((row, message_id))
+
+    def close(self) -> None:
+        """Signals the end of the rows and waits until every queued row was handled."""
+        self._queue.put(None)
+        self._thread.join()
+
+    @property
+    def saved_ids(self) -> List[Optional[str]]:
+        """IDs of the messages whose rows were saved, in upload order."""
+        with self._lock:
+            return list(self._saved_ids)
+
+    def _run(self) -> None:
+        finished = False
+        while not finished:
+            # Block until a minimum batch (or the end) arrives, then take whatever else is waiting
+            items = [self._queue.get()]
+            while len(items) < _SHEETS_MIN_APPEND_ROWS and items[-1] is not None:
+                items.append(self._queue.get())
+            while len(items) < _SHEETS_MAX_APPEND_ROWS and items[-1] is not None:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if items[-1] is None:
+                finished = True
+                items.pop()
+            if not items:
+                continue
+
+            rows = [row for row, _ in items]
+            try:
+                append_rows(self._sheets_service, rows)
+            except Exception as e:
+                # Do not mark these messages as read: their data was not saved
+                logger.critical("Failed to save %d rows to Google Sheets: %s. Data lost for this run.", len(rows), e)
+                self.failed_rows += len(rows)
+                continue
+            with self._lock:
+                self._saved_ids.extend(message_id for _, message_id in items)
+            self.saved_rows += len(rows)
+
+
 def run_pipeline() -> None:
     """
     Executes the entire email processing pipeline.
     """
+    # Attach the console/file handlers once; every module logger propagates to them
+    configure_root()
+
     # --- Step 1: Authentication and Service Initialization ---
     try:
         creds = get_credentials()
@@ -105,41 +277,33 @@ def run_pipeline() -> None:
         messages = []
         return
 
-    rows: List[List[Any]] = []
-    processed_ids: List[str] = []
-
-    # --- Step 4: Parse Messages and Prepare Rows ---
-    for m in messages:
-        message_id = m.get("id")
-        try:
-            parsed = parse_email(m)
-            rows.append(build_row(parsed, header=FINAL_HEADER))
-            processed_ids.append(parsed.get("Message ID"))
-        except Exception as e:
-            logger.error("Failed to parse message id=%s: %s", message_id, e)
-
-    # --- Step 5: Write to Sheets ---
-    if rows:
-        try:
-            append_rows(sheets_service, rows)
-            logger.info("Successfully saved %d rows to Google Sheets.", len(rows))
-        except Exception as e:
-            logger.critical("Failed to save to Google Sheets: %s. Data lost for this run.", e)
-            # Do not mark as read if we failed to save the data.
-            return
-    else:
-        logger.warning("No rows successfully generated from parsed messages.")
+    # --- Step 4 & 5: Parse Messages and Write Rows to Sheets ---
+    # Rows are uploaded by a background writer while the remaining messages are parsed
+    writer = _SheetWriter(sheets_service)
+    try:
+        for parsed in iter_parsed_messages(messages):
+            writer.put(build_row(parsed, header=FINAL_HEADER), parsed.get("Message ID"))
+    finally:
+        writer.close()
+        # Memoized regex results are only useful while parsing; release the bodies they hold
+        clear_search_cache()
+
+    if not writer.saved_rows:
+        if not writer.failed_rows:
+            logger.warning("No rows successfully generated from parsed messages.")
         # No need to mark anything as read if nothing was parsed/saved.
         return
+    logger.info("Successfully saved %d rows to Google Sheets.", writer.saved_rows)
+
+    # Only messages whose rows were saved are marked as read
+    processed_ids = writer.saved_ids
 
     # --- Step 6: Mark Processed Messages as Read ---
-    for mid in processed_ids:
-        if mid:
-            try:
-                mark_as_read(gmail_service, mid)
-            except Exception as e:
-                # Log the error but continue processing other messages
-                logger.error("Failed to mark message %s as read: %s", mid, e)
+    try:
+        # One batchModify request per 1000 messages instead of one request per message
+        mark_many_as_read(gmail_service, [mid for mid in processed_ids if mid])
+    except Exception as e:
+        logger.error("Failed to mark %d messages as read: %s", len(processed_ids), e)
 
     logger.info("Pipeline completed successfully for %d emails.", len(processed_ids))
 
@@ -1,36 +1,80 @@
-from typing import List, Any, Dict, Optional
+import functools
+import logging
+import random
+from typing import List, Any, Dict, Optional, Sequence, Tuple
 from googleapiclient.errors import HttpError
 import time
 
-from utils.logger import setup_logger
 import config
 
-logger = setup_logger(__name__)
+logger = logging.getLogger(__name__)
 
 _INITIAL_BACKOFF = 1.0  # seconds
 _MAX_ATTEMPTS = 5
+_MAX_TOTAL_BACKOFF = 30.0  # seconds; a call gives up rather than sleep longer than this in total
 
 
-def ensure_header_row(sheets_service: object, header: List[str],
-                      spreadsheet_id: str = config.SPREADSHEET_ID,
-                      sheet_name: str = config.SHEET_NAME) -> None:
+def _backoff_delay(attempt: int) -> float:
+    """
+    Returns the exponential backoff delay for a retry attempt with "equal jitter"
+    (a random value between half and all of the delay), so concurrent writers that
+    hit the same quota limit do not retry in lockstep.
+
+    Args:
+        attempt: The 1-based number of the failed attempt.
+
+    Returns:
+        The number of seconds to sleep before the next attempt.
+    """
+    delay = _INITIAL_BACKOFF * (2 ** attempt)
+    return delay * (0.5 + random.random() * 0.5)
+
+
+@functools.lru_cache(maxsize=8)
+def _header_values(header: Tuple[str, ...]) -> List[List[str]]:
+    """
+    Returns the header as the `values` payload of a one-row range, built once per header.
+
+    Args:
+        header: The required header column names.
+
+    Returns:
+        A single-row list of lists, e.g. [["Date", "From", ...]]. Callers must not mutate it.
+    """
+    return [list(header)]
+
+
+def ensure_header_row(sheets_service: object, header: Sequence[str],
+                      spreadsheet_id: Optional[str] = None,
+                      sheet_name: Optional[str] = None) -> None:
     """
     Checks if the first row of the Google Sheet contains a header. If the row is
     empty, the predefined header row is written. If an existing header is found
     that DOES NOT MATCH the required header, an error is raised to prevent data misalignment.
 
+    The row is read on every call (one GET per run), so a header that was edited,
+    cleared or recreated since the last run is always caught before rows are appended.
+
     Args:
         sheets_service: The initialized Google Sheets API service object.
-        header: The list of required header column names based on PARSING_MAP.
+        header: The required header column names based on PARSING_MAP (tuple or list).
         spreadsheet_id: The ID of the target Google Sheet document.
+                        Defaults to config.SPREADSHEET_ID.
         sheet_name: The name of the specific sheet/tab within the document.
+                    Defaults to config.SHEET_NAME.
 
     Raises:
         ValueError: If a mismatched header is detected.
         HttpError: If the API request fails persistently.
     """
+    spreadsheet_id = spreadsheet_id or config.SPREADSHEET_ID
+    sheet_name = sheet_name or config.SHEET_NAME
+    header = tuple(header)  # No copy when given a tuple such as pipeline.FINAL_HEADER
+    header_row = _header_values(header)
+
     range_name = f"{sheet_name}!A1:Z1"
     attempt = 0
+    waited = 0.0
 
     while True:
         try:
@@ -42,13 +86,22 @@ def ensure_header_row(sheets_service: object, header: List[str],
             ).execute()
 
             values: List[List[str]] = resp.get("values", [])
+            # Present if any cell has content; any() stops at the first non-blank cell (almost
+            # always A1). A row of blank cells counts as empty and gets the header written.
+            is_header_present = bool(values) and any(cell.strip() for cell in values[0])
+
+            if is_header_present:
+                # Common case: the stored header is exactly the expected one; a direct list
+                # comparison settles it without building a cleaned copy of the row
+                if values[0] == header_row[0]:
+                    logger.debug("Header already exists and matches expected format in sheet %s.", sheet_name)
+                    return
 
-            if values and values[0]:
                 # Clean and filter the existing header for comparison
                 existing_header = [cell.strip() for cell in values[0] if cell.strip()]
 
                 # Check if the existing header matches the expected header up to the columns present
-                if existing_header == header[:len(existing_header)]:
+                if existing_header == header_row[0][:len(existing_header)]:
                     logger.debug("Header already exists and matches expected format in sheet %s.", sheet_name)
                     return
                 else:
@@ -61,7 +114,6 @@ def ensure_header_row(sheets_service: object, header: List[str],
                     raise ValueError("Mismatched Google Sheet header detected. Script aborted.")
 
             # 2. Write the header if the first row is completely empty or missing
-            header_row: List[List[str]] = [header]
             sheets_service.spreadsheets().values().update(
                 spreadsheetId=spreadsheet_id,
                 range=range_name,
@@ -74,12 +126,14 @@ def ensure_header_row(sheets_service: object, header: List[str],
         except HttpError as e:
             attempt += 1
             # Check for rate limits or server errors for retries
-            if e.resp.status in (429, 500, 503) and attempt < _MAX_ATTEMPTS:
-                delay = _INITIAL_BACKOFF * (2 ** attempt)
+            delay = _backoff_delay(attempt)
+            if (e.resp.status in (429, 500, 503) and attempt < _MAX_ATTEMPTS
+                    and waited + delay <= _MAX_TOTAL_BACKOFF):
                 logger.warning(
                     f"HttpError writing header (attempt {attempt}): {e.resp.status}. Retrying in {delay:.1f}s"
                 )
                 time.sleep(delay)
+                waited += delay
                 continue
             else:
                 logger.error(f"HttpError: Failed to ensure header row after retries on sheet {sheet_name}: {e}")
@@ -94,8 +148,8 @@ def ensure_header_row(sheets_service: object, header: List[str],
 
 
 def append_rows(sheets_service: object, rows: List[List[str]],
-                spreadsheet_id: str = config.SPREADSHEET_ID,
-                sheet_name: str = config.SHEET_NAME) -> Optional[Dict[str, Any]]:
+                spreadsheet_id: Optional[str] = None,
+                sheet_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
     """
     Appends multiple rows of data to the Google Sheet.
 
@@ -103,7 +157,9 @@ def append_rows(sheets_service: object, rows: List[List[str]],
         sheets_service: The initialized Google Sheets API service object.
         rows: A list of rows to append. Each row is a list of cell values (strings).
         spreadsheet_id: The ID of the target Google Sheet document.
+                        Defaults to config.SPREADSHEET_ID.
         sheet_name: The name of the specific sheet/tab within the document.
+                    Defaults to config.SHEET_NAME.
 
     Returns:
         A dictionary containing update metadata from the API response, or None if
@@ -116,11 +172,15 @@ def append_rows(sheets_service: object, rows: List[List[str]],
         logger.info("No rows to append. Skipping API call.")
         return None
 
+    spreadsheet_id = spreadsheet_id or config.SPREADSHEET_ID
+    sheet_name = sheet_name or config.SHEET_NAME
+
     # The range specifies where to start appending. The 'append' method finds the
     # first empty row automatically.
     range_name = f"{sheet_name}!A1"
     body = {"values": rows}
     attempt = 0
+    waited = 0.0
 
     while True:
         try:
@@ -128,8 +188,8 @@ def append_rows(sheets_service: object, rows: List[List[str]],
                 spreadsheetId=spreadsheet_id,
                 range=range_name,
                 valueInputOption="RAW",
-                # INSERT_ROWS is safer than OVERWRITE as it preserves data/formulas below the current sheet size.
-                insertDataOption="INSERT_ROWS",
+                # No insertDataOption: the default (OVERWRITE) writes into the empty rows after the
+                # table instead of making the server shift every row below it (INSERT_ROWS).
                 body=body
             ).execute()
 
@@ -140,12 +200,14 @@ def append_rows(sheets_service: object, rows: List[List[str]],
         except HttpError as e:
             attempt += 1
             # Check for rate limits or server errors for retries
-            if e.resp.status in (429, 500, 503) and attempt < _MAX_ATTEMPTS:
-                delay = _INITIAL_BACKOFF * (2 ** attempt)
+            delay = _backoff_delay(attempt)
+            if (e.resp.status in (429, 500, 503) and attempt < _MAX_ATTEMPTS
+                    and waited + delay <= _MAX_TOTAL_BACKOFF):
                 logger.warning(
                     f"HttpError appending rows (attempt {attempt}): {e.resp.status}. Retrying in {delay:.1f}s"
                 )
                 time.sleep(delay)
+                waited += delay
                 continue
             else:
                 logger.error(f"HttpError: Failed to append rows after retries on sheet {sheet_name}: {e}")
@@ -0,0 +1,188 @@
+"""
+Regression checks for the patterns built and run by `parsing_tools`.
+
+Run from the repository root with: python -m unittest discover tests
+"""
+import random
+import re
+import unittest
+
+import parsing_tools
+from parsing_tools import (
+    CombinedMatcher,
+    build_combined_matcher,
+    build_key_value_pattern,
+    extract_all,
+    extract_key_value,
+    extract_regex_pattern,
+    prepare_parsing_map,
+)
+
+_STATUS = {"key_patterns": ["Status", "Order Status"], "delimiter": r"\s*[:\-\#]\s*"}
+_DATE = {"pattern": r"Date\s*:\s*(\d{4}[-/]\d{2}[-/]\d{2}|\d{1,2}[-/]\d{1,2}[-/]\d{2,4})"}
+_CUSTOMER = {"pattern": r"Customer:\s*(\w+)"}
+
+
+def _prepared(instruction, **extra):
+    """Returns a compiled copy of a parsing instruction, as config.PARSING_MAP holds them."""
+    prepared = dict(instruction, **extra)
+    prepare_parsing_map([prepared])
+    return prepared
+
+
+class KeyValuePatternTests(unittest.TestCase):
+
+    def test_delimiter_padding_is_not_doubled(self):
+        # Two adjacent whitespace runs backtrack quadratically over long whitespace
+        pattern = build_key_value_pattern(_STATUS)
+        self.assertNotIn(r"\s*\s*", pattern)
+        self.assertNotIn(r"[ \t]*\s*", pattern)
+        self.assertNotIn(r"\s*[ \t]*", pattern)
+        self.assertEqual(build_key_value_pattern({"key_patterns": ["Total"], "delimiter": ":"}),
+                         r"(?:Total)\s*:\s*([^\n\r]*)")
+
+    def test_long_whitespace_without_delimiter(self):
+        text = "Status" + " " * 8000 + "shipped"
+        # Stdlib re directly, so the check holds even when google-re2 is installed
+        self.assertIsNone(re.compile(build_key_value_pattern(_STATUS), re.IGNORECASE).search(text))
+        self.assertEqual(extract_key_value(text, dict(_STATUS)), "")
+
+    def test_long_single_line_body(self):
+        text = "x" * 100_000 + " Status: shipped " + "y" * 100_000
+        self.assertEqual(extract_key_value(text, dict(_STATUS)), "shipped " + "y" * 100_000)
+
+    def test_value_stops_at_end_of_line(self):
+        self.assertEqual(extract_key_value("Order Status - shipped\r\nTotal: 5", dict(_STATUS)), "shipped")
+
+
+
+def _extract_separately(text, parsing_map):
+    """The per-instruction extraction `extract_all` must reproduce (parse_email's loop)."""
+    results = {}
+    for instruction in parsing_map:
+        if instruction["method"] == "key_value":
+            value = extract_key_value(text, instruction)
+        else:
+            value = extract_regex_pattern(text, instruction)
+        if value:
+            results[instruction["output_field"]] = value
+    return results
+
+
+class _CountingPattern:
+    """Wraps a compiled pattern and counts the searches run with it."""
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.calls = 0
+
+    def search(self, *args):
+        self.calls += 1
+        return self.pattern.search(*args)
+
+    def match(self, *args):
+        self.calls += 1
+        return self.pattern.match(*args)
+
+
+class CombinedMatcherTests(unittest.TestCase):
+
+    def assertSameAsSeparate(self, text, parsing_map):
+        matcher = build_combined_matcher(parsing_map)
+        self.assertEqual(matcher.indices, frozenset(range(len(parsing_map))))
+        self.assertEqual(extract_all(text, matcher), _extract_separately(text, parsing_map), text)
+
+    def test_rules_sharing_a_key(self):
+        parsing_map = [
+            _prepared(_STATUS, method="key_value", output_field="Order Status"),
+            _prepared({"key_patterns": ["Status"], "delimiter": ":"}, method="key_value",
+                      output_field="Status"),
+        ]
+        for text in ("Status: shipped", "Order Status - late\nStatus: shipped", "Status: \nStatus: ok"):
+            self.assertSameAsSeparate(text, parsing_map)
+
+    def test_key_value_next_to_regex_rule_on_the_same_key(self):
+        parsing_map = [
+            _prepared({"key_patterns": ["Date"], "delimiter": ":"}, method="key_value", output_field="Date"),
+            _prepared(_DATE, method="regex_pattern", output_field="Invoice Date"),
+        ]
+        for text in ("Date: 2024-01-02", "Date: soon\nDate: 1/2/24", "Invoice Date : 2024/01/02 (paid)"):
+            self.assertSameAsSeparate(text, parsing_map)
+
+    def test_randomized_bodies_match_separate_extraction(self):
+        parsing_map = [
+            _prepared(_STATUS, method="key_value", output_field="Order Status"),
+            _prepared({"key_patterns": ["State"], "delimiter": r"\s*[:\-\#]\s*"}, method="key_value",
+                      output_field="Order Status"),
+            _prepared({"key_patterns": ["Total", "Total Amount"], "delimiter": ":"}, method="key_value",
+                      output_field="Total Amount"),
+            _prepared({"key_patterns": ["Date"], "delimiter": ":"}, method="key_value", output_field="Date"),
+            _prepared(_DATE, method="regex_pattern", output_field="Invoice Date"),
+        ]
+        fragments = ["Status", "Order Status", "State", "Total", "Total Amount", "Date", ":", " - ", "#",
+                     " ", "\n", "\r\n", "\xa0", "shipped", "$12.50", "2024-01-02", "1/2/24", "x"]
+        rng = random.Random(1234)
+        for _ in range(500):
+            text = "".join(rng.choice(fragments) for _ in range(rng.randint(1, 30)))
+            self.assertSameAsSeparate(text, parsing_map)
+
+    def test_missing_field_is_searched_once_on_many_hit_bodies(self):
+        parsing_map = [
+            _prepared(_STATUS, method="key_value", output_field="Order Status"),
+            _prepared({"key_patterns": ["State"], "delimiter": ":"}, method="key_value",
+                      output_field="State"),
+            _prepared({"key_patterns": ["Total"], "delimiter": ":"}, method="key_value",
+                      output_field="Total Amount"),
+        ]
+        matcher = build_combined_matcher(parsing_map)
+        counting = [_CountingPattern(own) for _, _, own in matcher.members]
+        counted_matcher = CombinedMatcher(
+            matcher.pattern,
+            tuple((i, field, pattern) for (i, field, _), pattern in zip(matcher.members, counting)),
+            matcher.indices,
+        )
+        # 16 KB of hits for one rule, while "Total" never appears
+        text = "State: a\n" * 1800
+        self.assertEqual(extract_all(text, counted_matcher), {"State": "a"})
+        self.assertEqual([pattern.calls for pattern in counting], [1, 1, 1])
+
+    def test_text_without_any_match(self):
+        matcher = build_combined_matcher([_prepared(_STATUS, method="key_value", output_field="Order Status")])
+        self.assertEqual(extract_all("nothing to see here " * 100, matcher), {})
+        self.assertEqual(extract_all("", matcher), {})
+
+
+class UnicodeTextTests(unittest.TestCase):
+
+    def test_key_value_accepts_unicode_whitespace(self):
+        status = _prepared(_STATUS, method="key_value", output_field="Order Status")
+        for text in ("Status\xa0: ok", "Status\u2003:\u2003ok", "Order Status\xa0-\xa0ok"):
+            self.assertEqual(extract_key_value(text, status), "ok", text)
+
+    def test_regex_pattern_accepts_unicode_whitespace_and_word_characters(self):
+        date = _prepared(_DATE, method="regex_pattern", output_field="Invoice Date")
+        customer = _prepared(_CUSTOMER, method="regex_pattern", output_field="Customer")
+        self.assertEqual(extract_regex_pattern("Date\xa0:\xa02024-01-02", date), "2024-01-02")
+        self.assertEqual(extract_regex_pattern("Customer: José Müller", customer), "José")
+
+    def test_combined_matcher_accepts_unicode_text(self):
+        parsing_map = [
+            _prepared(_STATUS, method="key_value", output_field="Order Status"),
+            _prepared(_CUSTOMER, method="regex_pattern", output_field="Customer"),
+        ]
+        matcher = build_combined_matcher(parsing_map)
+        self.assertEqual(matcher.indices, frozenset({0, 1}))
+        self.assertEqual(extract_all("Customer: José\nStatus\u2003:\u2003ok", matcher),
+                         {"Order Status": "ok", "Customer": "José"})
+
+    @unittest.skipIf(parsing_tools.re2 is None, "google-re2 is not installed")
+    def test_re2_is_opt_in_and_never_fused(self):
+        default = _prepared(_STATUS, method="key_value", output_field="Order Status")
+        opted_in = _prepared(_STATUS, method="key_value", output_field="Order Status", re2=True)
+        self.assertIsInstance(default["_compiled"], re.Pattern)
+        self.assertNotIsInstance(opted_in["_compiled"], re.Pattern)
+        self.assertIsNone(build_combined_matcher([opted_in]))
+
+
+if __name__ == "__main__":
+    unittest.main()
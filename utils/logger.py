@@ -2,17 +2,25 @@
 logger.py
 ------------
 
-This logger:
+Configures the root logger once (see `configure_root`); modules use
+`logging.getLogger(__name__)` and inherit its handlers. The root logger:
 - Prints clear logs to both the console and a file
 - Automatically rotates old log files to prevent huge files
 - Creates the log directory automatically
 - Has consistent, timestamped output
+- Writes from a background thread, off the calling code's path
+- Collects the records of worker processes (see `configure_worker`), so only the
+  parent process ever writes to the log file
 """
 
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import multiprocessing
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
-from typing import Final
+from typing import Final, Optional
 
 # Basic config settings
 LOG_DIR: Final[Path] = Path('logs')
@@ -21,55 +29,150 @@ LOG_LEVEL: Final[int] = logging.DEBUG  # Set the minimum severity level to handl
 MAX_BYTES: Final[int] = 5 * 1024 * 1024 # 5 MB maximum file size
 BACKUP_COUNT: Final[int] = 5          # Keep up to 5 rotated backup files
 
-def setup_logger(name: str = "app_logger") -> logging.Logger:
+# Third-party loggers that would otherwise flood the DEBUG output once the root logger is configured
+QUIET_LOGGERS: Final[tuple] = ("googleapiclient", "google_auth_httplib2", "google.auth", "urllib3")
+
+
+# Background listener that performs the actual console/file writes (see configure_root)
+_listener: Optional[QueueListener] = None
+# The listener's queue when it can be shared with worker processes (see get_log_queue)
+_log_queue: Optional["multiprocessing.Queue[logging.LogRecord]"] = None
+# PID of the process whose root logger was configured; a forked child inherits the
+# handlers but not the listener thread, so it must configure itself again
+_configured_pid: Optional[int] = None
+
+
+def _stop_listener() -> None:
+    """Flushes queued records and stops the background listener (registered with atexit)."""
+    global _listener, _log_queue
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    _log_queue = None
+
+
+def configure_root(level: int = LOG_LEVEL, threaded: bool = True) -> logging.Logger:
     """
-    Creates and returns a configured logger instance that handles both console and file output.
+    Attaches the console and rotating file handlers to the root logger, exactly once per process.
+
+    Modules log through plain `logging.getLogger(__name__)` loggers, which propagate
+    to the root logger, so only the entry point (e.g., `run_pipeline`) calls this.
+    Calling it again is a no-op.
 
     Uses a RotatingFileHandler to manage log file size and an explicit
-    formatter to ensure consistent, timestamped output.
+    formatter to ensure consistent, timestamped output. By default the root logger
+    only gets a QueueHandler, and a QueueListener thread does the console and disk
+    writes, so logging calls on the hot path cost a queue put.
 
     Args:
-        name: The name of the logger, typically __name__ from the calling module.
-              Defaults to "app_logger".
+        level: The minimum severity level to handle. Defaults to LOG_LEVEL.
+        threaded: Whether to write through a background QueueListener. Pass False to
+                  write synchronously from the calling thread instead.
 
     Returns:
-        A fully configured logging.Logger instance.
+        The configured root logger.
     """
-    # 1. Ensure the log directory exists
-    LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    global _listener, _log_queue, _configured_pid
+    root = logging.getLogger()
 
-    # 2. Create the Logger object
-    logger = logging.getLogger(name)
-    logger.setLevel(LOG_LEVEL)
-    # Setting propagate=False prevents log records from being sent to the
-    # root logger, which avoids duplicate log entries if the root logger is also configured.
-    logger.propagate = False
+    # 1. Prevent duplicate handlers if called multiple times in the same process
+    if _configured_pid == os.getpid():
+        return root
+    if _configured_pid is not None:
+        # Forked child: drop the inherited handlers (its queue has no listener)
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        _listener = None
+        _log_queue = None
 
-    # 3. Prevent duplicate handlers if called multiple times (e.g., in different modules)
-    if logger.handlers:
-        return logger
+    # 2. Ensure the log directory exists
+    LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    root.setLevel(level)
 
-    # 4. Define the format for log lines
+    # 3. Define the format for log lines
     # Example format: 2025-11-12 19:30:55 | app_logger | INFO | Starting email fetch process
     log_format = "%(asctime)s | %(name)s | %(levelname)s | %(message)s"
     date_format = "%Y-%m-%d %H:%M:%S"
     formatter = logging.Formatter(fmt=log_format, datefmt=date_format)
 
-    # 5. Console handler (prints logs to the terminal)
+    # 4. Console handler (prints logs to the terminal)
     console_handler = logging.StreamHandler()
-    console_handler.setLevel(LOG_LEVEL)
+    console_handler.setLevel(level)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
 
-    # 6. File handler (writes logs to log/general.log with rotation)
+    # 5. File handler (writes logs to log/general.log with rotation)
     file_handler = RotatingFileHandler(
         filename=LOG_FILE,
         maxBytes=MAX_BYTES,
         backupCount=BACKUP_COUNT,
         encoding="utf-8"
     )
-    file_handler.setLevel(LOG_LEVEL)
+    file_handler.setLevel(level)
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
 
-    return logger
\ No newline at end of file
+    # 6. Route records through a queue so the writes happen on the listener thread.
+    # A multiprocessing queue also carries the records of worker processes to it
+    if threaded:
+        try:
+            log_queue = _log_queue = multiprocessing.Queue(-1)
+        except (OSError, ImportError):
+            # No working multiprocessing semaphores (e.g., some sandboxes): this process only
+            log_queue = queue.Queue(-1)
+        root.addHandler(QueueHandler(log_queue))
+        _listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_stop_listener)
+    else:
+        root.addHandler(console_handler)
+        root.addHandler(file_handler)
+
+    # 7. Keep verbose library internals out of the application log
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    _configured_pid = os.getpid()
+    return root
+
+
+def get_log_queue() -> Optional["multiprocessing.Queue[logging.LogRecord]"]:
+    """
+    Returns the queue drained by this process's log listener, for `configure_worker`.
+
+    Returns:
+        The multiprocessing queue, or None if the root logger was not configured with
+        a listener or the platform cannot share queues between processes.
+    """
+    return _log_queue if _configured_pid == os.getpid() else None
+
+
+def configure_worker(log_queue: Optional["multiprocessing.Queue[logging.LogRecord]"],
+                     level: int = LOG_LEVEL) -> logging.Logger:
+    """
+    Configures the root logger of a worker process (e.g., a pool initializer) to send
+    its records to the parent's listener instead of opening the log file itself;
+    several processes rotating the same file is not supported.
+
+    Args:
+        log_queue: The parent's queue from `get_log_queue`. If None, the worker keeps
+                   only logging's last-resort stderr output for warnings and errors.
+        level: The minimum severity level to handle. Defaults to LOG_LEVEL.
+
+    Returns:
+        The configured root logger.
+    """
+    global _listener, _log_queue, _configured_pid
+    root = logging.getLogger()
+    # A forked worker inherits the parent's handlers and listener state; drop them
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    _listener = None
+    _log_queue = None
+
+    root.setLevel(level)
+    if log_queue is not None:
+        root.addHandler(QueueHandler(log_queue))
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    _configured_pid = os.getpid()
+    return root